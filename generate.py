@@ -1,5 +1,9 @@
+import multiprocessing
+import os
 import sys
-import copy
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from operator import itemgetter
 
 from crossword import *
 
@@ -11,10 +15,78 @@ class CrosswordCreator():
         Create new CSP crossword generate.
         """
         self.crossword = crossword
+        self._build_domains()
+        # residual supports: the last word of y that supported a letter of x,
+        # keyed by (x, y, letter)
+        self._residual = dict()
+        # overlaps as nested dictionaries, where self._ov[x][y] is the (i, j)
+        # overlap of x and y; pairs that do not overlap are left out
+        self._ov = {var: dict() for var in self.crossword.variables}
+        for (x, y), overlap in self.crossword.overlaps.items():
+            if overlap is not None:
+                self._ov[x][y] = overlap
+        # arcs between variables that overlap; arcs without an overlap never need revising
+        self._overlap_arcs = [
+            (x, y) for x in self._ov for y in self._ov[x]
+        ]
+        # neighbors of each variable, computed once instead of on every call
+        self._neighbors = {
+            var: frozenset(self.crossword.neighbors(var))
+            for var in self.crossword.variables
+        }
+        # number of neighbors of each variable, used to break MRV ties
+        self._degree = {
+            var: len(self._neighbors[var])
+            for var in self.crossword.variables
+        }
+
+    def _build_domains(self):
+        """
+        Build the domain of every variable in a single pass over the words,
+        keeping only the words of the variable's length. Alongside, index
+        the words by the letter at each position, and count those letters
+        to seed the cache used by revise and order_domain_values.
+        """
+        lengths = {var.length for var in self.crossword.variables}
+        words = {length: set() for length in lengths}
+        columns = {length: [dict() for _ in range(length)] for length in lengths}
+        for word in self.crossword.words:
+            if len(word) not in words:
+                continue
+            words[len(word)].add(word)
+            for k, letter in enumerate(word):
+                columns[len(word)][k].setdefault(letter, set()).add(word)
+
+        histograms = {
+            length: [
+                Counter({letter: len(column) for letter, column in position.items()})
+                for position in columns[length]
+            ]
+            for length in lengths
+        }
+        # domains are frozensets: they are replaced, never changed in place, which
+        # the caches below and the snapshots taken while backtracking rely on
+        domains = {length: frozenset(words[length]) for length in lengths}
         self.domains = {
-            var: self.crossword.words.copy()
+            var: domains[var.length]
+            for var in self.crossword.variables
+        }
+        # words of every length in the puzzle, grouped by the letter at each position
+        self._columns = {
+            var: columns[var.length]
+            for var in self.crossword.variables
+        }
+        # cache of overlap letter counts, keyed by variable and then by position;
+        # every entry holds the domain set it was counted from
+        self._histograms = {
+            var: {
+                index: (self.domains[var], histogram)
+                for index, histogram in enumerate(histograms[var.length])
+            }
             for var in self.crossword.variables
         }
+        # the same letters as bitmasks, cached the same way
+        self._masks = {var: dict() for var in self.crossword.variables}
 
     def letter_grid(self, assignment):
         """
@@ -25,11 +97,13 @@ class CrosswordCreator():
             for _ in range(self.crossword.height)
         ]
         for variable, word in assignment.items():
-            direction = variable.direction
-            for k in range(len(word)):
-                i = variable.i + (k if direction == Variable.DOWN else 0)
-                j = variable.j + (k if direction == Variable.ACROSS else 0)
-                letters[i][j] = word[k]
+            i, j = variable.i, variable.j
+            if variable.direction == Variable.ACROSS:
+                # an across word fills a run of a single row in one assignment
+                letters[i][j:j + len(word)] = word
+            else:
+                for k, letter in enumerate(word):
+                    letters[i + k][j] = letter
         return letters
 
     def print(self, assignment):
@@ -86,13 +160,52 @@ class CrosswordCreator():
 
         img.save(filename)
 
-    def solve(self):
+    def solve(self, workers=1):
         """
         Enforce node and arc consistency, and then solve the CSP.
+
+        With more than one worker (or `workers=None`, for one per CPU), the
+        domain of the first variable to be assigned is split between worker
+        processes, each searching its own part of the search space, and the
+        first solution found is returned. Which worker finishes first can
+        vary, so the same puzzle may then be filled differently on each run.
         """
         self.enforce_node_consistency()
-        self.ac3()
-        return self.backtrack(dict())
+        if not self.ac3():
+            return None
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        # a grid without any word slots has nothing to split
+        if workers < 2 or not self.crossword.variables:
+            return self.backtrack(dict())
+
+        root = self.select_unassigned_variable(dict())
+        values = self.order_domain_values(root, dict())
+        if len(values) < 2:
+            return self.backtrack(dict())
+
+        # deal the values out in turn so that every worker starts with promising ones
+        workers = min(workers, len(values))
+        chunks = [values[k::workers] for k in range(workers)]
+        cancel = multiprocessing.Event()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(cancel,)
+        ) as executor:
+            futures = [
+                executor.submit(_solve_partition, self, root, chunk)
+                for chunk in chunks
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                if result is not None:
+                    # stop the workers that are still searching
+                    cancel.set()
+                    return result
+
+        return None
 
     def enforce_node_consistency(self):
         """
@@ -100,16 +213,14 @@ class CrosswordCreator():
         (Remove any values that are inconsistent with a variable's unary
          constraints; in this case, the length of the word.)
         """
-        # for every value in the domain, if value is longer than constraint, remove it
-        for variable in self.domains:
-            values_to_be_removed = []
-            for value in self.domains[variable]:
-                if len(value) > variable.length:
-                    values_to_be_removed.append(value)
-
-            for value in values_to_be_removed:
-                self.domains[variable].remove(value)
-
+        # _build_domains already leaves only words of the right length, so a
+        # domain is only rebuilt when something was put in it since
+        for variable, domain in self.domains.items():
+            if any(len(value) != variable.length for value in domain):
+                self.domains[variable] = frozenset(
+                    value for value in domain
+                    if len(value) == variable.length
+                )
 
     def revise(self, x, y):
         """
@@ -120,28 +231,86 @@ class CrosswordCreator():
         Return True if a revision was made to the domain of `x`; return
         False if no revision was made.
         """
-        # for every possible word in x, there must be a word in y that starts with the same char at the overlap
-        revision_made = False
-        overlap_index = self.crossword.overlaps[(x, y)]
-        x_values_to_be_removed = []
-        for val_x in self.domains[x]:
-            found_y = False
-            for val_y in self.domains[y]:
-                try:
-                    if val_x[overlap_index[0]] == val_y[overlap_index[1]]:
-                        found_y = True
-                        break
-                except IndexError:
-                    continue
-
-            if found_y == False:
-                x_values_to_be_removed.append(val_x)
-                revision_made = True
+        # for every possible word in x, there must be a word in y that has the same char at the overlap
+        i, j = self._ov[x][y]
+        y_domain = self.domains[y]
+        y_columns = self._columns[y][j]
+        # when y's letters at the overlap are already counted, a bit test settles each letter
+        y_mask = self.overlap_mask(y, j)
+        x_letters = self.overlap_histogram(x, i)
+        unsupported = []
+        for letter in x_letters:
+            if y_mask is not None:
+                if not y_mask >> ord(letter) & 1:
+                    unsupported.append(letter)
+                continue
+            # the word of y that supported this letter last time is most likely still there
+            support = self._residual.get((x, y, letter))
+            if support in y_domain:
+                continue
+            # look for a new support through the vocabulary column when it is smaller;
+            # y may hold words outside the vocabulary, so fall back to its own domain
+            support = None
+            column = y_columns.get(letter, ())
+            if len(column) < len(y_domain):
+                support = next(filter(y_domain.__contains__, column), None)
+            if support is None:
+                support = next((value for value in y_domain if value[j] == letter), None)
+            if support is None:
+                unsupported.append(letter)
+            else:
+                self._residual[(x, y, letter)] = support
+        if not unsupported:
+            return False
+
+        # remove whole columns of words at once: every word of x with a letter y lacks at the overlap
+        x_domain = self.domains[x]
+        x_columns = self._columns[x][i]
+        revised = x_domain.difference(*(
+            x_columns.get(letter, ()) for letter in unsupported
+        ))
+        # the columns only hold words of the vocabulary; if they missed some of
+        # the words to remove, filter the domain itself
+        if len(revised) != len(x_domain) - sum(x_letters[letter] for letter in unsupported):
+            unsupported = set(unsupported)
+            revised = (value for value in x_domain if value[i] not in unsupported)
+
+        self.domains[x] = frozenset(revised)
+        return True
 
-        for value in x_values_to_be_removed:
-            self.domains[x].remove(value)
-    
-        return revision_made
+    def overlap_histogram(self, var, index):
+        """
+        Return a Counter of the letters found at position `index` across all
+        the values in `self.domains[var]`. Results are cached until
+        `self.domains[var]` is replaced by another set.
+        """
+        domain = self.domains[var]
+        cached = self._histograms[var].get(index)
+        if cached is None or cached[0] is not domain:
+            cached = domain, Counter(map(itemgetter(index), domain))
+            self._histograms[var][index] = cached
+        return cached[1]
+
+    def overlap_mask(self, var, index):
+        """
+        Return the letters found at position `index` across all the values
+        in `self.domains[var]` as a bitmask, with bit `ord(letter)` set for
+        every letter, or None if those letters have not been counted for the
+        current domain of `var` yet. Results are cached like
+        `overlap_histogram`.
+        """
+        domain = self.domains[var]
+        cached = self._masks[var].get(index)
+        if cached is not None and cached[0] is domain:
+            return cached[1]
+        counted = self._histograms[var].get(index)
+        if counted is None or counted[0] is not domain:
+            return None
+        mask = 0
+        for letter in counted[1]:
+            mask |= 1 << ord(letter)
+        self._masks[var][index] = domain, mask
+        return mask
 
     def ac3(self, arcs=None):
         """
@@ -152,43 +321,39 @@ class CrosswordCreator():
         Return True if arc consistency is enforced and no domains are empty;
         return False if one or more domains end up empty.
         """
-        # if arcs == None, start with an initial queue of all the arcs in the problem
-        if arcs == None:
-            arc_queue = []
-            for arc in self.crossword.overlaps:
-                arc_queue.append(arc)
-
-        while len(arc_queue) != 0:
-            arc = arc_queue.pop(0)
-            # if there is no overlap between the variables, continue
-            if self.crossword.overlaps[arc] == None:
+        # if arcs is None, start with an initial queue of all the arcs in the problem
+        if arcs is None:
+            arc_queue = deque(self._overlap_arcs)
+        else:
+            arc_queue = deque(arcs)
+        # keep track of queued arcs so that no arc is queued twice
+        in_queue = set(arc_queue)
+
+        while arc_queue:
+            x, y = arc_queue.popleft()
+            in_queue.discard((x, y))
+            if not self.revise(x, y):
                 continue
-            else:
-                revision_made =  self.revise(arc[0], arc[1])
-                
+
             # if during revision, all values from a domain have been removed, return false
-            if len(self.domains[arc[0]]) == 0:
-                return False 
-            # if a revision has been made to x, add to the queue all arcs that have x as the "destination"            
-            if revision_made == True:
-                for potential_arc in self.crossword.overlaps:
-                    if arc[0] == potential_arc[1]:
-                        arc_queue.append(potential_arc)
+            if len(self.domains[x]) == 0:
+                return False
+            # x has changed, so every arc pointing into x has to be checked again
+            for z in self._neighbors[x]:
+                if z != y and (z, x) not in in_queue:
+                    arc_queue.append((z, x))
+                    in_queue.add((z, x))
 
         return True
-         
 
     def assignment_complete(self, assignment):
         """
         Return True if `assignment` is complete (i.e., assigns a value to each
         crossword variable); return False otherwise.
         """
-        assignment_complete = True
-        for var in assignment:
-            if assignment[var] == None:
-                assignment_complete = False
-        
-        return assignment_complete
+        # an assignment only holds the variables that have been assigned a
+        # value, so it is complete exactly when it holds all of them
+        return len(assignment) == len(self.crossword.variables)
 
     def consistent(self, assignment):
         """
@@ -199,39 +364,71 @@ class CrosswordCreator():
         # that is to say, all values are distinct, every value is the correct length,
         # and there are no conflicts between neighboring variables.
 
-        
-        for var in assignment:
-            # if no value (word) has been assigned, continue
-            if assignment[var] == None:
-                continue
-            # check to see if every word is unique
-            for comp_var in assignment:
-                if var == comp_var:
-                    continue
-                if assignment[var] == assignment[comp_var] and assignment[var] != None:
-                    return False
+        # check to see if every word is unique
+        if len(set(assignment.values())) != len(assignment):
+            return False
 
-            # check to see if every value is in the correct length
-            if len(assignment[var]) != var.length:
+        # check to see if every value is in the correct length, before any
+        # value is indexed at an overlap
+        for var, word in assignment.items():
+            if len(word) != var.length:
                 return False
-        
+
+        for var, word in assignment.items():
             # check to see if there are no conflicting characters between neighboring variables
-            var_neighbors = self.crossword.neighbors(var)
-            for neighbor_var in var_neighbors:
+            for neighbor_var, (i, j) in self._ov[var].items():
                 # if the neighboring var doesnt have a value assigned, continue
-                if assignment[neighbor_var] == None:
-                    continue
-                # get the overlap between var and his neighbor
-                overlap_index = self.crossword.overlaps[(var, neighbor_var)]
-                if overlap_index == None:
+                if neighbor_var not in assignment:
                     continue
                 # compare characters at overlap indices
-                if assignment[var][overlap_index[0]] != assignment[neighbor_var][overlap_index[1]]:
+                if word[i] != assignment[neighbor_var][j]:
                     return False
 
         return True
 
-        
+    def consistent_assignment(self, assignment, var, value):
+        """
+        Return True if assigning `value` to `var` keeps an already consistent
+        `assignment` consistent (i.e., `value` agrees with every assigned
+        neighbor of `var` at their overlap); return False otherwise.
+        Uniqueness of `value` is left to the caller.
+        """
+        for neighbor_var, (i, j) in self._ov[var].items():
+            if neighbor_var not in assignment:
+                continue
+            if value[i] != assignment[neighbor_var][j]:
+                return False
+
+        return True
+
+    def maintain_arc_consistency(self, assignment, var, value):
+        """
+        Reduce the domain of `var` to `value`, and make every arc pointing
+        into `var` arc consistent again, propagating any removals.
+
+        Return True if no domain ends up empty; return False otherwise.
+        """
+        self.domains[var] = frozenset((value,))
+        return self.ac3(arcs=[
+            (neighbor_var, var)
+            for neighbor_var in self._neighbors[var]
+            if neighbor_var not in assignment
+        ])
+
+    def snapshot_domains(self):
+        """
+        Return a snapshot of `self.domains` that `restore_domains` can
+        return to. Domains are frozensets that are replaced rather than
+        changed in place, so copying the dictionary is enough.
+        """
+        return self.domains.copy()
+
+    def restore_domains(self, snapshot):
+        """
+        Restore `self.domains` to a snapshot taken by `snapshot_domains`.
+        """
+        self.domains.update(snapshot)
+
     def order_domain_values(self, var, assignment):
         """
         Return a list of values in the domain of `var`, in order by
@@ -239,41 +436,40 @@ class CrosswordCreator():
         The first value in the list, for example, should be the one
         that rules out the fewest values among the neighbors of `var`.
         """
-        all_var_values = self.domains[var]
-
-        # create a dictionary for mapping values to eliminations
+        # for every unassigned neighbor, count the letters its values have at the overlap
+        positions = []
+        neighbor_histograms = []
+        for neighbor_var, (i, j) in self._ov[var].items():
+            # if neighbor_var has already been assigned in assignment, dont count it
+            if neighbor_var in assignment:
+                continue
+            positions.append(i)
+            neighbor_histograms.append((
+                self.overlap_histogram(neighbor_var, j),
+                len(self.domains[neighbor_var])
+            ))
+
+        if not positions:
+            return list(self.domains[var])
+
+        # values with the same letters at the overlaps rule out the same neighboring values,
+        # so score every distinct combination of overlap letters only once
+        overlap_letters = itemgetter(*positions)
         value_elimination_dict = {}
-        for value in all_var_values:
-            value_elimination_dict[value] = None
-        
-        # get a list of all of var's neighbors
-        var_neighbors = self.crossword.neighbors(var)
-        # for every value in domains[var], count how many variables are ruled out for neighboring variables
-        for value in self.domains[var]:
-            num_ruled_out = 0
-            for neighbor_var in var_neighbors:
-                # if neighbor_var has already been assigned in assignment, dont count it
-                if assignment[neighbor_var] != None:
-                    continue
-                for comp_value in self.domains[neighbor_var]:
-                    # check how many values are ruled out for being identical
-                    if comp_value == value:
-                        num_ruled_out = num_ruled_out + 1
-                        continue            
-                    # check how many values are ruled out for not matching overlap characters
-                    vars_overlap_index = self.crossword.overlaps[(var, neighbor_var)]
-                    try:
-                        if value[vars_overlap_index[0]] != comp_value[vars_overlap_index[1]]:
-                            num_ruled_out = num_ruled_out + 1
-                    except IndexError:
-                        num_ruled_out = num_ruled_out + 1
-
-
-            # add the variable with its elimination count to the dictionary
-            value_elimination_dict[value] = num_ruled_out
-
-        sorted_dict_list = sorted(value_elimination_dict, key=value_elimination_dict.get)
-        return sorted_dict_list
+        for key in set(map(overlap_letters, self.domains[var])):
+            letters = key if len(positions) > 1 else (key,)
+            # a value rules out every neighboring value without its letter at the overlap
+            value_elimination_dict[key] = sum(
+                size - histogram[letter]
+                for letter, (histogram, size) in zip(letters, neighbor_histograms)
+            )
+
+        # sort (score, value) pairs without calling back into Python for every value
+        scored_values = zip(
+            map(value_elimination_dict.__getitem__, map(overlap_letters, self.domains[var])),
+            self.domains[var]
+        )
+        return list(map(itemgetter(1), sorted(scored_values)))
 
     def select_unassigned_variable(self, assignment):
         """
@@ -283,52 +479,100 @@ class CrosswordCreator():
         degree. If there is a tie, any of the tied variables are acceptable
         return values.
         """
-        fewest_values = 10000
-        fewest_values_var = None
-        for var in assignment:
-            # if var has no assignment, check how many values are in its domain
-            if assignment[var] == None:
-                if len(self.domains[var]) < fewest_values:
-                    fewest_values_var = var
-                    fewest_values = len(self.domains[var])
-
-        return fewest_values_var
+        unassigned = [
+            var for var in self.crossword.variables
+            if var not in assignment
+        ]
+        # fewest remaining values first, then the highest degree
+        return min(
+            unassigned,
+            key=lambda var: (len(self.domains[var]), -self._degree[var])
+        )
 
-    def backtrack(self, assignment):
+    def backtrack(self, assignment, used_words=None):
         """
         Using Backtracking Search, take as input a partial assignment for the
         crossword and return a complete assignment if possible to do so.
 
-        `assignment` is a mapping from variables (keys) to words (values).
+        `assignment` is a mapping from variables (keys) to words (values);
+        unassigned variables are left out rather than mapped to None.
+        `used_words` is the reverse mapping from words to variables; it is
+        built from `assignment` if not given.
 
         If no assignment is possible, return None.
         """
-        # if given an empty assignment, create a new one
-        if len(assignment) == 0:
-            for var in self.crossword.variables:
-                assignment[var] = None
+        if used_words is None:
+            used_words = {word: var for var, word in assignment.items()}
+
+        # another worker has already found a solution
+        if _cancel is not None and _cancelled():
+            return None
 
         if self.assignment_complete(assignment):
             return assignment
 
         var = self.select_unassigned_variable(assignment)
         for value in self.order_domain_values(var, assignment):
-            # check if value is cosistent with the constraints
-            deep_copy_assignment = copy.deepcopy(assignment)
-            deep_copy_assignment[var] = value
-            if self.consistent(deep_copy_assignment):                
-                assignment[var] = value
-                result = self.backtrack(assignment)
-                if result != None:
+            # every word can only be used once
+            if value in used_words:
+                continue
+            # the rest of the assignment is consistent, so only var has to be checked
+            if not self.consistent_assignment(assignment, var, value):
+                continue
+
+            assignment[var] = value
+            used_words[value] = var
+            snapshot = self.snapshot_domains()
+            if self.maintain_arc_consistency(assignment, var, value):
+                result = self.backtrack(assignment, used_words)
+                if result is not None:
                     return result
-                
-                # if result is a failure, remove it from the assignment
-                assignment[var] = None
+
+            # if result is a failure, remove it from the assignment
+            self.restore_domains(snapshot)
+            del assignment[var]
+            del used_words[value]
         # if gone through every var, and no satisfying assignment possible,
         # return None
         return None
 
-            
+
+# in worker processes of `CrosswordCreator.solve`, the event set once a solution is found
+_cancel = None
+# reading the event takes a lock, so it is only read once per this many search nodes
+_CANCEL_CHECK_INTERVAL = 1024
+_nodes = 0
+_stopped = False
+
+
+def _init_worker(cancel):
+    """
+    Initialize a worker process of `CrosswordCreator.solve`.
+    """
+    global _cancel
+    _cancel = cancel
+
+
+def _cancelled():
+    """
+    Return True once another worker process of `CrosswordCreator.solve`
+    has found a solution. Once it returns True, it keeps returning True.
+    """
+    global _nodes, _stopped
+    if not _stopped:
+        _nodes += 1
+        if _nodes % _CANCEL_CHECK_INTERVAL == 0:
+            _stopped = _cancel.is_set()
+    return _stopped
+
+
+def _solve_partition(creator, root, values):
+    """
+    Solve the CSP of `creator` with the domain of `root` restricted to
+    `values`. Return the assignment found, or None.
+    """
+    creator.domains[root] = frozenset(values)
+    return creator.backtrack(dict())
 
 
 def main():
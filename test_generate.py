@@ -0,0 +1,147 @@
+import os
+import tempfile
+import unittest
+
+from crossword import *
+from generate import CrosswordCreator
+
+
+def check_assignment(test, crossword, assignment):
+    """
+    Check that `assignment` is a complete and consistent fill of `crossword`.
+    """
+    test.assertIsNotNone(assignment)
+    test.assertEqual(set(assignment), crossword.variables)
+    test.assertEqual(len(set(assignment.values())), len(assignment))
+    for var, word in assignment.items():
+        test.assertEqual(len(word), var.length)
+        test.assertIn(word, crossword.words)
+    for (x, y), overlap in crossword.overlaps.items():
+        if overlap is not None:
+            i, j = overlap
+            test.assertEqual(assignment[x][i], assignment[y][j])
+
+
+def make_crossword(structure, words):
+    """
+    Return a Crossword built from the given structure and word lines.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        structure_file = os.path.join(directory, "structure.txt")
+        words_file = os.path.join(directory, "words.txt")
+        with open(structure_file, "w") as f:
+            f.write("\n".join(structure))
+        with open(words_file, "w") as f:
+            f.write("\n".join(words))
+        return Crossword(structure_file, words_file)
+
+
+class SolveTest(unittest.TestCase):
+
+    def test_solve(self):
+        for n in range(3):
+            crossword = Crossword(f"data/structure{n}.txt", f"data/words{n}.txt")
+            assignment = CrosswordCreator(crossword).solve()
+            check_assignment(self, crossword, assignment)
+
+    def test_solve_in_parallel(self):
+        for n in range(3):
+            crossword = Crossword(f"data/structure{n}.txt", f"data/words{n}.txt")
+            assignment = CrosswordCreator(crossword).solve(workers=2)
+            check_assignment(self, crossword, assignment)
+
+    def test_no_solution(self):
+        crossword = Crossword("data/structure1.txt", "data/words0.txt")
+        self.assertIsNone(CrosswordCreator(crossword).solve())
+        self.assertIsNone(CrosswordCreator(crossword).solve(workers=2))
+
+    def test_no_solution_in_parallel(self):
+        # arc consistent, but every fill needs a word twice
+        crossword = make_crossword(["___", "_#_", "___"], ["AAA", "ABA", "AAB"])
+        self.assertIsNone(CrosswordCreator(crossword).solve(workers=2))
+
+    def test_no_word_slots(self):
+        for structure in (["###", "###"], ["#_#"], ["#", "_"]):
+            crossword = make_crossword(structure, ["ONE"])
+            self.assertEqual(CrosswordCreator(crossword).solve(), {})
+            self.assertEqual(CrosswordCreator(crossword).solve(workers=2), {})
+
+
+class DomainTest(unittest.TestCase):
+
+    def test_domains_stay_frozen(self):
+        crossword = Crossword("data/structure2.txt", "data/words2.txt")
+        creator = CrosswordCreator(crossword)
+        creator.enforce_node_consistency()
+        creator.ac3()
+        for domain in creator.domains.values():
+            self.assertIsInstance(domain, frozenset)
+
+    def test_cache_follows_assigned_domains(self):
+        crossword = Crossword("data/structure0.txt", "data/words0.txt")
+        creator = CrosswordCreator(crossword)
+        var = next(var for var in crossword.variables if var.length == 3)
+        creator.overlap_histogram(var, 0)
+        creator.domains[var] = frozenset(
+            word for word in creator.domains[var] if word[0] == "T"
+        )
+        self.assertEqual(set(creator.overlap_histogram(var, 0)), {"T"})
+
+
+class ReviseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.crossword = Crossword("data/structure0.txt", "data/words0.txt")
+        self.creator = CrosswordCreator(self.crossword)
+        self.x = Variable(0, 1, Variable.ACROSS, 3)
+        self.y = Variable(0, 1, Variable.DOWN, 5)
+
+    def test_words_outside_the_vocabulary(self):
+        self.creator.domains[self.x] = frozenset({"ZZZ", "TWO"})
+        self.creator.domains[self.y] = frozenset({"THREE"})
+        self.assertTrue(self.creator.revise(self.x, self.y))
+        self.assertEqual(self.creator.domains[self.x], {"TWO"})
+
+    def test_letter_shared_with_the_vocabulary(self):
+        self.creator.domains[self.x] = frozenset({"TWO", "SQQ"})
+        self.creator.domains[self.y] = frozenset({"THREE"})
+        self.assertTrue(self.creator.revise(self.x, self.y))
+        self.assertEqual(self.creator.domains[self.x], {"TWO"})
+
+    def test_support_outside_the_vocabulary(self):
+        self.creator.domains[self.x] = frozenset({"ONE", "TQQ"})
+        self.creator.domains[self.y] = frozenset({"OXXXX"})
+        self.assertTrue(self.creator.revise(self.x, self.y))
+        self.assertEqual(self.creator.domains[self.x], {"ONE"})
+
+    def test_no_revision(self):
+        domain = frozenset({"TWO", "SIX"})
+        self.creator.domains[self.x] = domain
+        self.creator.domains[self.y] = frozenset({"SEVEN", "THREE", "SXXXX"})
+        self.assertFalse(self.creator.revise(self.x, self.y))
+        self.assertIs(self.creator.domains[self.x], domain)
+
+
+class NodeConsistencyTest(unittest.TestCase):
+
+    def test_removes_words_of_the_wrong_length(self):
+        crossword = Crossword("data/structure0.txt", "data/words0.txt")
+        creator = CrosswordCreator(crossword)
+        creator.domains = {var: set(crossword.words) for var in crossword.variables}
+        creator.enforce_node_consistency()
+        for var, domain in creator.domains.items():
+            self.assertEqual(domain, {
+                word for word in crossword.words if len(word) == var.length
+            })
+
+    def test_keeps_consistent_domains(self):
+        crossword = Crossword("data/structure0.txt", "data/words0.txt")
+        creator = CrosswordCreator(crossword)
+        domains = creator.domains.copy()
+        creator.enforce_node_consistency()
+        for var in crossword.variables:
+            self.assertIs(creator.domains[var], domains[var])
+
+
+if __name__ == "__main__":
+    unittest.main()